@@ -1,37 +1,74 @@
 from __future__ import annotations
 from pathlib import Path
 from typing import Dict, List, Tuple
-import json, math, datetime as dt
+import math, datetime as dt
+import orjson
+
+from .index_bm25 import iter_jsonl
+from .parse import ROLE_CODES
+from .semantic import VEC_FILES
 
 LN2 = math.log(2.0)
+EDGE_TYPES = ("reply", "same_topic")  # edges.npz "type" column codes
 
 def _load_rows(ddir: Path):
-    rows = []
-    with (ddir / "rows.jsonl").open("r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                rows.append(json.loads(line))
-            except Exception:
-                continue
-    return rows
+    return list(iter_jsonl(ddir / "rows.jsonl"))
 
 def _load_meta(ddir: Path) -> Dict[str, dict]:
     p = ddir / "meta.json"
-    return json.loads(p.read_text(encoding="utf-8")) if p.exists() else {}
+    return orjson.loads(p.read_bytes()) if p.exists() else {}
 
 def _load_vecs(ddir: Path):
-    p = ddir / "vecs.npz"
-    if not p.exists():
+    """(ids, int8 vecs) or (None, None); only row directions matter, so the per-row scales are not needed."""
+    if not all((ddir / name).exists() for name in VEC_FILES):
         return None, None
     import numpy as np
-    z = np.load(p)
-    return z["ids"], z["vecs"]
+    return np.load(ddir / "ids.npy"), np.load(ddir / "vecs.npy", mmap_mode="r")
+
+TILE_ROWS = 1024
 
-def _cos(a, b):
+def _same_topic_pairs(vecs, groups: List[List[int]], k: int, min_cos: float):
+    """
+    Yield (src_rows, dst_rows, sims) for each row's top-k same-conversation neighbours.
+    Whole conversations are packed into blocks of ~TILE_ROWS rows and each block is one
+    block-diagonal GEMM with cross-conversation pairs masked out; a block is computed in
+    TILE_ROWS-row tiles so the intermediate stays bounded even for one huge conversation.
+    """
     import numpy as np
-    na = np.linalg.norm(a); nb = np.linalg.norm(b)
-    if na == 0 or nb == 0: return 0.0
-    return float(a.dot(b) / (na * nb))
+    blocks, cur, size = [], [], 0
+    for g in groups:
+        if cur and size + len(g) > TILE_ROWS:
+            blocks.append(cur)
+            cur, size = [], 0
+        cur.append(g)
+        size += len(g)
+    if cur:
+        blocks.append(cur)
+
+    for blk in blocks:
+        sel = np.concatenate([np.asarray(g) for g in blk])
+        conv = np.repeat(np.arange(len(blk)), [len(g) for g in blk])
+        # Rows are int8; upcast per block so BLAS sgemm runs it (exact for int8 sums)
+        # and rescale by the quantized norms.
+        V = vecs[sel].astype(np.float32)
+        qn = np.sqrt(np.einsum("ij,ij->i", V, V))
+        qn[qn == 0] = 1.0
+        n = len(sel)
+        kk = min(k, n - 1)
+        for r0 in range(0, n, TILE_ROWS):
+            r1 = min(n, r0 + TILE_ROWS)
+            S = V[r0:r1] @ V.T
+            S /= qn[r0:r1, None] * qn[None, :]
+            S[conv[r0:r1, None] != conv[None, :]] = -np.inf
+            S[np.arange(r1 - r0), np.arange(r0, r1)] = -np.inf
+            # top-k per row by partial selection, then order just the k winners
+            top = np.argpartition(-S, kk - 1, axis=1)[:, :kk]
+            sims = np.take_along_axis(S, top, axis=1)
+            order = np.argsort(-sims, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            sims = np.take_along_axis(sims, order, axis=1)
+            a, c = np.nonzero(sims >= min_cos)
+            yield sel[r0 + a], sel[top[a, c]], sims[a, c]
 
 def build_edges(ddir: Path, same_topic_k: int = 3, same_topic_min_cos: float = 0.60):
     rows = _load_rows(ddir)
@@ -47,7 +84,14 @@ def build_edges(ddir: Path, same_topic_k: int = 3, same_topic_min_cos: float = 0
             "role": r.get("role"),
         }
 
-    edges: List[Dict] = []
+    import numpy as np
+    # Edges are kept columnar: one array chunk per (src, dst, w, type) batch
+    src_parts, dst_parts, w_parts, type_parts = [], [], [], []
+    def add(src, dst, w, etype: str):
+        src_parts.append(np.asarray(src, dtype=np.int64))
+        dst_parts.append(np.asarray(dst, dtype=np.int64))
+        w_parts.append(np.broadcast_to(np.asarray(w, dtype=np.float32), (len(src_parts[-1]),)))
+        type_parts.append(np.full(len(src_parts[-1]), EDGE_TYPES.index(etype), dtype=np.int8))
 
     # 1) Reply-chain / adjacency edges within a conversation
     from collections import defaultdict
@@ -56,89 +100,88 @@ def build_edges(ddir: Path, same_topic_k: int = 3, same_topic_min_cos: float = 0
         by_conv[r["conv_id"]].append(r)
     for conv_id, lst in by_conv.items():
         lst.sort(key=lambda x: x.get("ts") or "")
-        for i in range(len(lst) - 1):
-            a = int(lst[i]["msg"]); b = int(lst[i + 1]["msg"])
-            edges.append({"src": a, "dst": b, "w": 2.0, "type": "reply"})
+        msgs = [int(r["msg"]) for r in lst]
+        add(msgs[:-1], msgs[1:], 2.0, "reply")
 
     # 2) Same-topic edges via dense vecs (optional)
     ids, vecs = _load_vecs(ddir)
-    if ids is not None:
-        import numpy as np
+    if ids is not None and same_topic_k > 0:
         id_to_idx = {int(i): j for j, i in enumerate(ids.tolist())}
+        groups = []
         for conv_id, lst in by_conv.items():
-            if same_topic_k <= 0:
-                continue
             # consider small local candidate pool: the conversation itself
             idxs = [id_to_idx[int(r["msg"])] for r in lst if int(r["msg"]) in id_to_idx]
-            for j in idxs:
-                v = vecs[j]
-                # quick top-k by cosine against others in the same conversation
-                sims = []
-                for k in idxs:
-                    if k == j: continue
-                    s = _cos(v, vecs[k])
-                    if s >= same_topic_min_cos:
-                        sims.append((k, s))
-                sims.sort(key=lambda t: t[1], reverse=True)
-                for k, s in sims[:same_topic_k]:
-                    edges.append({"src": int(ids[j]), "dst": int(ids[k]), "w": float(1.0 + s), "type": "same_topic"})
+            if len(idxs) >= 2:
+                groups.append(idxs)
+        for src, dst, sims in _same_topic_pairs(vecs, groups, same_topic_k, same_topic_min_cos):
+            add(ids[src], ids[dst], 1.0 + sims, "same_topic")
 
     # Write edges
-    out = ddir / "edges.jsonl"
-    with out.open("w", encoding="utf-8") as f:
-        for e in edges:
-            f.write(json.dumps(e) + "\n")
+    out = ddir / "edges.npz"
+    cat = lambda parts, dtype: np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+    np.savez_compressed(
+        out,
+        src=cat(src_parts, np.int64),
+        dst=cat(dst_parts, np.int64),
+        w=cat(w_parts, np.float32),
+        type=cat(type_parts, np.int8),
+    )
     return {"edges_path": str(out)}
 
-def build_pagerank(ddir: Path, alpha: float = 0.15, half_life_days: float = 180.0):
+def build_pagerank(ddir: Path, alpha: float = 0.15, half_life_days: float = 180.0,
+                   max_iter: int = 100, tol: float = 1e-6):
     try:
-        import networkx as nx
+        import numpy as np
+        import scipy.sparse as sp
     except ImportError as e:
-        raise RuntimeError("networkx is required for /pr/build. Install in your venv: pip install networkx") from e
+        raise RuntimeError("scipy is required for /pr/build. Install in your venv: pip install scipy") from e
 
     # Load edges
-    edges = []
-    with (ddir / "edges.jsonl").open("r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                e = json.loads(line)
-                edges.append((int(e["src"]), int(e["dst"]), float(e.get("w", 1.0))))
-            except Exception:
-                continue
-
-    G = nx.DiGraph()
-    for s, d, w in edges:
-        G.add_edge(s, d, weight=w)
-
-    # Personalization/recency (teleport vector)
-    meta = json.loads((ddir / "meta.json").read_text(encoding="utf-8"))
-    def recency_boost(ts: str) -> float:
-        try:
-            t = dt.datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
-        except Exception:
-            return 0.0
-        age_days = max(0.0, (dt.datetime.now(dt.timezone.utc).timestamp() - t) / 86400.0)
-        return math.exp(-LN2 * age_days / max(half_life_days, 1e-3))
-
-    p = {}
-    for k, v in meta.items():
-        msg = int(k)
-        b = 1e-6
-        b += recency_boost(v.get("ts") or "")
-        if (v.get("role") or "").lower() == "assistant":
-            b += 0.05
-        if v.get("has_code"):
-            b += 0.05
-        p[msg] = b
+    z = np.load(ddir / "edges.npz")
+    src, dst, w = z["src"], z["dst"], z["w"].astype(np.float64)
+    E = len(src)
+
+    # Remap msg ids -> 0..n-1 and build a row-stochastic CSR transition matrix
+    nodes, inv = np.unique(np.concatenate([src, dst]), return_inverse=True)
+    n = len(nodes)
+    M = sp.csr_matrix((w, (inv[:E], inv[E:])), shape=(n, n))
+
+    S = np.asarray(M.sum(axis=1)).ravel()
+    dangling = S == 0
+    S[~dangling] = 1.0 / S[~dangling]
+    M = sp.spdiags(S, 0, n, n, format="csr") @ M
+
+    # Personalization/recency (teleport vector), built column-wise from meta.npz
+    cols = np.load(ddir / "meta.npz")
+    ts = cols["ts"]
+    now = np.datetime64(dt.datetime.now(dt.timezone.utc).replace(tzinfo=None), "s")
+    age_days = np.maximum(0.0, (now - ts).astype(np.float64) / 86400.0)
+    recency = np.where(np.isnat(ts), 0.0, np.exp(-LN2 * age_days / max(half_life_days, 1e-3)))
+    assistant = cols["role"] == ROLE_CODES.index("assistant")
+    boost = 1e-6 + recency + 0.05 * assistant + 0.05 * cols["has_code"]
+
+    msgs = cols["msg"]
+    j = np.searchsorted(nodes, msgs)
+    hit = j < n
+    hit[hit] = nodes[j[hit]] == msgs[hit]
+    p = np.zeros(n, dtype=float)
+    p[j[hit]] = boost[hit]
 
     # Normalize personalization vector
-    s = sum(p.values()) or 1.0
-    p = {k: v / s for k, v in p.items() if k in G}
-
-    # networkx uses alpha = damping (follow links). Our API alpha = teleport prob.
-    nx_alpha = 1.0 - max(0.0, min(alpha, 1.0))
-    pr = nx.pagerank(G, alpha=nx_alpha, personalization=p, weight="weight")
+    s = p.sum()
+    p = p / s if s > 0 else np.full(n, 1.0 / max(n, 1))
+
+    # Power iteration; our API alpha = teleport prob, so links are followed with 1 - alpha.
+    # Mass sitting on dangling nodes is redistributed along the teleport vector.
+    damping = 1.0 - max(0.0, min(alpha, 1.0))
+    x = p.copy()
+    for _ in range(max_iter):
+        x_new = damping * (M.T @ x + x[dangling].sum() * p) + (1.0 - damping) * p
+        err = np.abs(x_new - x).sum()
+        x = x_new
+        if err < n * tol:
+            break
 
     # Save
-    (ddir / "pr_global.json").write_text(json.dumps({str(k): float(v) for k, v in pr.items()}), encoding="utf-8")
-    return {"nodes": len(G), "edges": len(edges), "alpha": alpha, "half_life_days": half_life_days, "out": str(ddir / "pr_global.json")}
+    (ddir / "pr_global.json").write_bytes(orjson.dumps({str(k): float(v) for k, v in zip(nodes.tolist(), x)}))
+    return {"nodes": n, "edges": E, "alpha": alpha, "half_life_days": half_life_days, "out": str(ddir / "pr_global.json")}
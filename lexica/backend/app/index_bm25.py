@@ -1,171 +1,410 @@
 from __future__ import annotations
 from pathlib import Path
-import json, math, re
-from collections import defaultdict, Counter
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import mmap, os, re, threading
+import numpy as np
+import orjson
 
-# simple, code-aware tokenizer
-_CAMEL = re.compile(r'(?<!^)(?=[A-Z])')
-_WORDS = re.compile(r"[a-zA-Z0-9_]+")
+try:
+    from numba import njit
+except ImportError:  # optional; decoding and scoring then use the vectorized NumPy kernels
+    njit = None
+
+# simple, code-aware tokenizer: a single scan yields identifier parts, splitting
+# snake_case on "_" and camelCase / acronyms on case changes ("myHTTPServer" -> my, http, server)
+_TOKEN = re.compile(r"[a-z0-9]+|[A-Z]+(?=[A-Z][a-z])|[A-Z][a-z]+|[A-Z]+|[0-9]+")
 
 STOP = set("""
 a an and are as at be by for from has have i in is it its of on or that the to was were will with you your
 """.split())
 
-def split_ident(tok: str):
-    # snake_case + camelCase splits
-    parts = tok.split('_')
-    res = []
-    for p in parts:
-        # split camel: "myHTTPServer" -> ["my", "HTTP", "Server"]
-        res.extend(_CAMEL.sub(' ', p).split())
-    return [r for r in res if r]
-
 def tokenize(text: str):
-    """Lowercase, wordish chars, keep identifiers split by _ and camel, drop stopwords."""
+    """Lowercased identifier parts (split on _ and camel case), stopwords dropped."""
     if not text:
         return []
-    text = text.strip().lower()
-    toks = _WORDS.findall(text)
-    out: list[str] = []
-    for t in toks:
-        if t in STOP:
-            continue
-        out.append(t)
-        # extra splits (mostly effective on snake_case after .lower())
-        for part in split_ident(t):
-            p = part.lower()
-            if p != t and p not in STOP:
-                out.append(p)
-    return out
+    return [t for t in map(str.lower, _TOKEN.findall(text)) if t not in STOP]
+
+def iter_jsonl(p: Path):
+    """Yield decoded rows of a .jsonl file, scanning an mmap for newlines; bad lines are skipped."""
+    with p.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos, end = 0, len(mm)
+            while pos < end:
+                nl = mm.find(b"\n", pos)
+                if nl == -1:
+                    nl = end
+                line = mm[pos:nl]
+                pos = nl + 1
+                try:
+                    yield orjson.loads(line)
+                except ValueError:
+                    continue
 
 # ---------------- BM25 core ----------------
 
+# On-disk artifacts written by build_bm25 (besides meta.json from /parse)
+BM25_FILES = ("terms.json", "postings.bin", "term_offsets.npy", "df.npy", "idf.npy", "maxscore.npy",
+              "doclen.npy", "docs.npy", "stats.json")
+
+# Postings are delta-encoded and bitpacked in blocks of BLOCK postings:
+#   [doc_bits:u8][freq_bits:u8][packed doc gaps - 1][packed tf - 1]
+BLOCK = 128
+
+def _pack(vals: np.ndarray, bits: int) -> bytes:
+    if bits == 0:
+        return b""
+    bitmat = (vals[:, None] >> np.arange(bits, dtype=vals.dtype)) & 1
+    return np.packbits(bitmat.astype(np.uint8).ravel(), bitorder="little").tobytes()
+
+def _encode_postings(docs: np.ndarray, tfs: np.ndarray) -> bytes:
+    """Encode one term's ascending doc ids + tfs as delta/bitpacked blocks."""
+    gaps = np.diff(docs.astype(np.int64), prepend=-1) - 1
+    freqs = tfs.astype(np.int64) - 1
+    out = bytearray()
+    for lo in range(0, len(docs), BLOCK):
+        g, f = gaps[lo:lo + BLOCK], freqs[lo:lo + BLOCK]
+        db, fb = int(g.max()).bit_length(), int(f.max()).bit_length()
+        out += bytes((db, fb))
+        out += _pack(g, db)
+        out += _pack(f, fb)
+    return bytes(out)
+
+_LANES = np.arange(BLOCK, dtype=np.int64)
+
+def _decode_postings_np(buf: np.ndarray, pos: int, df: int):
+    """Decode one term's postings starting at byte pos -> (dense doc ids, tfs)."""
+    if df == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # Block offsets depend on the widths before them, so only the block headers are
+    # walked in Python; every value is then extracted in one vectorized pass per field.
+    hdr = memoryview(buf)
+    nblk = -(-df // BLOCK)
+    tail = df - (nblk - 1) * BLOCK
+    start, heads = pos, []
+    for _ in range(nblk - 1):
+        heads.append(pos)
+        pos += 2 + BLOCK // 8 * (hdr[pos] + hdr[pos + 1])
+    heads.append(pos)
+    pos += 2 + (tail * hdr[pos] + 7) // 8 + (tail * hdr[pos + 1] + 7) // 8
+
+    # Value i of a block sits at bit i * width of its payload: read the 8 bytes from its
+    # first byte as one little-endian word (zero-padded past the term), shift and mask.
+    seg = np.zeros(pos - start + 8, dtype=np.uint8)
+    seg[:pos - start] = buf[start:pos]
+    words = np.ndarray((pos - start + 1,), dtype="<u8", buffer=seg, strides=(1,))
+    heads = np.array(heads, dtype=np.int64)
+    db, fb = buf[heads].astype(np.int64), buf[heads + 1].astype(np.int64)
+    lane = np.tile(_LANES, nblk)[:df]
+    n = np.full(nblk, BLOCK, dtype=np.int64)
+    n[-1] = tail
+
+    def field(first: np.ndarray, w: np.ndarray) -> np.ndarray:
+        bit = lane * np.repeat(w, BLOCK)[:df]
+        vals = words[np.repeat(first, BLOCK)[:df] + (bit >> 3)] >> (bit & 7).astype(np.uint64)
+        vals &= np.repeat((np.uint64(1) << w.astype(np.uint64)) - np.uint64(1), BLOCK)[:df]
+        return vals.astype(np.int64)
+
+    first = heads - start + 2
+    gaps = field(first, db)
+    freqs = field(first + (n * db + 7) // 8, fb)
+    return np.cumsum(gaps + 1) - 1, freqs + 1
+
+def _decode_postings_loop(buf, pos, df):
+    """Scalar twin of _decode_postings_np: one pass over the blocks, for numba to compile."""
+    docs = np.empty(df, dtype=np.int64)
+    tfs = np.empty(df, dtype=np.int64)
+    doc = -1
+    for lo in range(0, df, BLOCK):
+        n = min(BLOCK, df - lo)
+        db, fb = np.int64(buf[pos]), np.int64(buf[pos + 1])
+        gpos = pos + 2
+        fpos = gpos + (n * db + 7) // 8
+        for field in range(2):
+            w, payload = (db, gpos) if field == 0 else (fb, fpos)
+            for i in range(n):
+                bit = i * w
+                byte, sh = payload + (bit >> 3), bit & 7
+                v = np.int64(0)
+                for k in range((sh + w + 7) // 8):
+                    v |= np.int64(buf[byte + k]) << (8 * k)
+                v = (v >> sh) & ((np.int64(1) << w) - 1)
+                if field == 0:
+                    doc += v + 1
+                    docs[lo + i] = doc
+                else:
+                    tfs[lo + i] = v + 1
+        pos = fpos + (n * fb + 7) // 8
+    return docs, tfs
+
+_decode_postings = njit(cache=True, nogil=True)(_decode_postings_loop) if njit is not None else _decode_postings_np
+
+def _open_postings(p: Path) -> np.ndarray:
+    with p.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return np.zeros(0, dtype=np.uint8)
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return np.frombuffer(mm, dtype=np.uint8)
+
 def build_bm25(ddir: Path, k1: float = 1.2, b: float = 0.75):
     """
-    Build a light BM25 inverted index over rows.jsonl:
-      - index.json : { term: [[doc_id, tf], ...] }
-      - idf.json   : { term: idf }
-      - doclen.json: { doc_id: length_in_tokens }
-      - stats.json : { terms, docs, avg_len, k1, b }
+    Build a light BM25 inverted index over rows.jsonl, stored as Structure-of-Arrays.
+    Docs are remapped to a dense 0..N-1 index; postings are delta+bitpacked per term:
+      - terms.json      : [term, ...]  (term id = position)
+      - postings.bin    : BLOCK-sized packed blocks of (doc gap, tf) per term
+      - term_offsets.npy: int64[T+1] byte boundaries of each term in postings.bin
+      - df.npy          : int32[T] postings per term
+      - idf.npy         : float64[T] idf per term
+      - maxscore.npy    : float64[T] upper bound of a term's BM25 contribution (for MaxScore)
+      - doclen.npy      : int32[N] length_in_tokens per dense doc
+      - docs.npy        : int64[N] dense doc -> msg id
+      - stats.json      : { terms, docs, avg_len, k1, b }
     """
     rows_path = ddir / "rows.jsonl"
     if not rows_path.exists():
         raise FileNotFoundError("rows.jsonl not found. Run /parse first.")
 
-    postings: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
-    doclen: dict[int, int] = {}
-    docs = 0
-
-    with rows_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                row = json.loads(line)
-            except Exception:
-                continue
-            doc_id = int(row["msg"])
-            text = row.get("text") or ""
-            toks = tokenize(text)
-            if not toks:
-                doclen[doc_id] = 0
-                docs += 1
-                continue
-            cnt = Counter(toks)
-            for term, tf in cnt.items():
-                postings[term][doc_id] += int(tf)
-            doclen[doc_id] = int(sum(cnt.values()))
-            docs += 1
-
-    if docs == 0:
+    # Terms are interned to int ids as they are first seen; tfs are aggregated per
+    # doc in a plain dict and flushed as (term id, doc, tf) into flat int32 buffers.
+    vocab: dict[str, int] = {}
+    intern = vocab.setdefault
+    post_terms = array("i")
+    post_docs = array("i")
+    post_tfs = array("i")
+    add_terms, add_docs, add_tfs = post_terms.extend, post_docs.extend, post_tfs.extend
+    doclen: list[int] = []
+    msg_ids: list[int] = []
+
+    for row in iter_jsonl(rows_path):
+        doc = len(msg_ids)
+        msg_ids.append(int(row["msg"]))
+        toks = tokenize(row.get("text") or "")
+        doclen.append(len(toks))
+        if not toks:
+            continue
+        tf_local: dict[str, int] = {}
+        get = tf_local.get
+        for t in toks:
+            tf_local[t] = get(t, 0) + 1
+        add_terms([intern(t, len(vocab)) for t in tf_local])
+        add_docs([doc] * len(tf_local))
+        add_tfs(tf_local.values())
+
+    N = len(msg_ids)
+    if N == 0:
         raise RuntimeError("No documents found to index.")
 
-    # idf
-    N = docs
-    idf: dict[str, float] = {}
-    for term, plist in postings.items():
-        df = len(plist)
-        # BM25+ style idf (robust)
-        idf[term] = math.log((N - df + 0.5) / (df + 0.5) + 1.0)
+    # CSR postings: docs were appended in ascending order, so a stable sort by
+    # term id groups each term's postings while keeping them doc-sorted.
+    T = len(vocab)
+    tids = np.frombuffer(post_terms, dtype=np.int32)
+    order = np.argsort(tids, kind="stable")
+    doc_ids = np.frombuffer(post_docs, dtype=np.int32)[order]
+    tfs = np.frombuffer(post_tfs, dtype=np.int32)[order]
+    df = np.bincount(tids, minlength=T)
+    offsets = np.zeros(T + 1, dtype=np.int64)
+    np.cumsum(df, out=offsets[1:])
+
+    terms = list(vocab)
+    # BM25+ style idf (robust)
+    idf = np.log((N - df + 0.5) / (df + 0.5) + 1.0)
 
     # avg doc len
-    avg_len = (sum(doclen.values()) / max(1, len(doclen)))
-
-    # Write files
-    # index.json as compact postings: { term: [[doc, tf], ...] }
-    index_path = ddir / "index.json"
-    with index_path.open("w", encoding="utf-8") as f:
-        json.dump({t: [[int(d), int(tf)] for d, tf in plist.items()]
-                   for t, plist in postings.items()}, f, ensure_ascii=False)
-
-    (ddir / "idf.json").write_text(json.dumps(idf), encoding="utf-8")
-    (ddir / "doclen.json").write_text(json.dumps({str(d): int(L) for d, L in doclen.items()}), encoding="utf-8")
-    (ddir / "stats.json").write_text(json.dumps({
-        "terms": len(idf),
+    avg_len = (sum(doclen) / max(1, N))
+
+    # per-term MaxScore bound: the best contribution any of its postings can make
+    maxscore = np.zeros(len(terms), dtype=np.float64)
+    if len(tfs):
+        tf = tfs.astype(np.float64)
+        dl = np.array(doclen, dtype=np.float64)[doc_ids]
+        contrib = tf * (k1 + 1.0) / (tf + k1 * (1 - b + b * (dl / max(1.0, avg_len))))
+        maxscore = idf * np.maximum.reduceat(contrib, offsets[:-1])
+
+    # Write files. Unlink first so readers still mapping the previous index keep
+    # their old inodes instead of seeing files truncated underneath them.
+    for name in BM25_FILES:
+        (ddir / name).unlink(missing_ok=True)
+    (ddir / "terms.json").write_bytes(orjson.dumps(terms))
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    with (ddir / "postings.bin").open("wb") as f:
+        for j in range(len(terms)):
+            lo, hi = int(offsets[j]), int(offsets[j + 1])
+            term_offsets[j + 1] = term_offsets[j] + f.write(_encode_postings(doc_ids[lo:hi], tfs[lo:hi]))
+    np.save(ddir / "term_offsets.npy", term_offsets)
+    np.save(ddir / "df.npy", df.astype(np.int32))
+    np.save(ddir / "idf.npy", idf)
+    np.save(ddir / "maxscore.npy", maxscore)
+    np.save(ddir / "doclen.npy", np.array(doclen, dtype=np.int32))
+    np.save(ddir / "docs.npy", np.array(msg_ids, dtype=np.int64))
+    (ddir / "stats.json").write_bytes(orjson.dumps({
+        "terms": len(terms),
         "docs": int(N),
         "avg_len": float(avg_len),
         "k1": float(k1),
         "b": float(b),
-    }), encoding="utf-8")
+    }))
 
-    return {"terms": len(idf), "docs": int(N), "avg_len": float(avg_len)}
+    return {"terms": len(terms), "docs": int(N), "avg_len": float(avg_len)}
 
 def _load_json(p: Path):
-    return json.loads(p.read_text(encoding="utf-8"))
+    return orjson.loads(p.read_bytes())
 
-def bm25_search(ddir: Path, query: str, topk: int = 10, k1: float | None = None, b: float | None = None):
+_INDEX_LOCK = threading.Lock()
+_POOL = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+def load_index(ddir: Path) -> dict:
+    """BM25 artifacts of a dataset, parsed/mmapped once and reused until any file's mtime changes."""
+    mtimes = tuple((ddir / name).stat().st_mtime_ns for name in BM25_FILES + ("meta.json",))
+    with _INDEX_LOCK:
+        return _load_index(str(ddir), mtimes)
+
+@lru_cache(maxsize=16)
+def _load_index(ddir: str, mtimes: tuple) -> dict:
+    d = Path(ddir)
+    stats = _load_json(d / "stats.json")
+    doclen = np.load(d / "doclen.npy", mmap_mode="r")
+    return {
+        "vocab":    {t: j for j, t in enumerate(_load_json(d / "terms.json"))},
+        "postings": _open_postings(d / "postings.bin"),
+        "term_off": np.load(d / "term_offsets.npy", mmap_mode="r"),
+        "df":       np.load(d / "df.npy", mmap_mode="r"),
+        "idf":      np.load(d / "idf.npy", mmap_mode="r"),
+        "maxscore": np.load(d / "maxscore.npy", mmap_mode="r"),
+        "doclen":   doclen,
+        # K1 * (1 - B + B * dl / avg_len) per doc for the build-time k1/b
+        "lennorm":  _length_norm(doclen, stats),
+        "docs":     np.load(d / "docs.npy", mmap_mode="r"),
+        "stats":    stats,
+        "meta":     _load_meta(str(d / "meta.json"), mtimes[-1]),
+    }
+
+def load_meta(ddir: Path) -> dict:
+    """msg id -> meta from meta.json, shared with load_index and reused until its mtime changes."""
+    p = ddir / "meta.json"
+    return _load_meta(str(p), p.stat().st_mtime_ns)
+
+@lru_cache(maxsize=16)
+def _load_meta(path: str, mtime_ns: int) -> dict:
+    # int-keyed once here so lookups per hit don't format strings
+    return {int(k): v for k, v in _load_json(Path(path)).items()}
+
+def _length_norm(doclen, stats: dict, k1: float | None = None, b: float | None = None) -> np.ndarray:
+    K1 = float(k1 if k1 is not None else stats.get("k1", 1.2))
+    B  = float(b  if b  is not None else stats.get("b", 0.75))
+    avg_len = max(1.0, float(stats.get("avg_len", 1.0)))
+    return (K1 * (1 - B + B * (doclen / avg_len))).astype(np.float32)
+
+_NO_HITS = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+
+def _bm25_accum_np(scores, d, tf, lennorm, w: float, k1: float, cut: float):
+    """scores[d] += one term's BM25 contribution, skipping docs whose score is <= cut."""
+    if cut > -np.inf:
+        live = scores[d] > cut
+        d, tf = d[live], tf[live]
+    tf = tf.astype(np.float32)
+    # doc ids are unique within a posting list, so a plain fancy-index add is safe
+    scores[d] += w * ((tf * (k1 + 1.0)) / np.maximum(1e-9, tf + lennorm[d]))
+
+def _bm25_accum_loop(scores, d, tf, lennorm, w, k1, cut):
+    """Scalar twin of _bm25_accum_np: filter and accumulate in one pass, for numba to compile."""
+    wf, k1p1, eps = np.float32(w), np.float32(k1 + 1.0), np.float32(1e-9)
+    for i in range(d.size):
+        doc = d[i]
+        if scores[doc] > cut:
+            t = np.float32(tf[i])
+            scores[doc] += wf * (t * k1p1 / max(eps, t + lennorm[doc]))
+
+_bm25_accum = njit(cache=True, nogil=True)(_bm25_accum_loop) if njit is not None else _bm25_accum_np
+
+def bm25_rank(ddir: Path, query: str, topk: int = 10, k1: float | None = None, b: float | None = None):
     """
-    Score docs with BM25. Returns list[ {msg, score, conv_id, title, role, ts} ].
-    Requires: index.json, idf.json, doclen.json, stats.json, meta.json.
+    Score docs with BM25. Returns (msg ids, scores) of the top-k docs as arrays, best first.
+    Requires the BM25_FILES written by build_bm25 plus meta.json.
     """
-    idx_path = ddir / "index.json"
-    idf_path = ddir / "idf.json"
-    dl_path  = ddir / "doclen.json"
-    st_path  = ddir / "stats.json"
-    meta_path= ddir / "meta.json"
-
-    if not (idx_path.exists() and idf_path.exists() and dl_path.exists() and st_path.exists() and meta_path.exists()):
+    if not all((ddir / name).exists() for name in BM25_FILES + ("meta.json",)):
         raise FileNotFoundError("Missing BM25 files. Build index first.")
 
-    index = _load_json(idx_path)          # term -> [[doc, tf], ...]
-    idf   = _load_json(idf_path)          # term -> idf
-    doclen= {int(k): int(v) for k, v in _load_json(dl_path).items()}
-    stats = _load_json(st_path)
-    meta  = _load_json(meta_path)
+    idx = load_index(ddir)
+    vocab, postings, term_off, df = idx["vocab"], idx["postings"], idx["term_off"], idx["df"]
+    idf, maxsc, doclen, docs = idx["idf"], idx["maxscore"], idx["doclen"], idx["docs"]
+    stats = idx["stats"]
 
-    avg_len = float(stats.get("avg_len", 1.0))
     K1 = float(k1 if k1 is not None else stats.get("k1", 1.2))
     B  = float(b  if b  is not None else stats.get("b", 0.75))
+    # build-time bounds are only valid for the k1/b they were computed with
+    exact_bounds = K1 == float(stats.get("k1", 1.2)) and B == float(stats.get("b", 0.75))
 
-    q_terms = tokenize(query)
+    # each distinct term scores once, however often the query repeats it
+    q_terms = list(dict.fromkeys(tokenize(query)))
     if not q_terms:
-        return []
-
-    scores: dict[int, float] = defaultdict(float)
-    seen_docs: set[int] = set()
+        return _NO_HITS
 
+    # (term id, idf, upper bound), highest-impact terms first; unknown and
+    # zero-idf terms are dropped before any postings are decoded
+    plan = []
     for t in q_terms:
-        plist = index.get(t)
-        if not plist:
+        j = vocab.get(t)
+        if j is None:
             continue
-        w = float(idf.get(t, 0.0))
+        w = float(idf[j])
         if w <= 0:
             continue
-        for doc_id, tf in plist:
-            dl = doclen.get(int(doc_id), 0)
-            denom = tf + K1 * (1 - B + B * (dl / max(1.0, avg_len)))
-            s = w * ((tf * (K1 + 1.0)) / max(1e-9, denom))
-            scores[int(doc_id)] += s
-            seen_docs.add(int(doc_id))
-
-    if not scores:
-        return []
+        plan.append((j, w, float(maxsc[j]) if exact_bounds else w * (K1 + 1.0)))
+    if not plan:
+        return _NO_HITS
+    plan.sort(key=lambda x: x[2], reverse=True)
+
+    # per-doc length normalization; cached with the index unless k1/b are overridden
+    lennorm = idx["lennorm"] if exact_bounds else _length_norm(doclen, stats, K1, B)
+    scores = np.zeros(len(doclen), dtype=np.float32)
+
+    # MaxScore: once the bounds of the terms still to go can't lift an unseen doc
+    # past the current k-th score, those terms are non-essential and only need to
+    # update docs that are already in contention.
+    # Decoding a term's postings doesn't depend on the threshold, so multi-term
+    # queries decode on the shared pool while earlier terms are being scored.
+    def decode(entry):
+        j = entry[0]
+        return _decode_postings(postings, int(term_off[j]), int(df[j]))
+    decoded = _POOL.map(decode, plan) if len(plan) > 1 else map(decode, plan)
+
+    remaining = sum(u for _, _, u in plan)
+    theta = 0.0
+    for n, ((j, w, u), (d, tf)) in enumerate(zip(plan, decoded)):
+        floor = theta * (1.0 - 1e-6)  # slack for float32 rounding in scores
+        # only docs above cut can still reach the floor once the remaining bounds are added
+        cut = floor - remaining if remaining < floor else -np.inf
+        remaining -= u
+        _bm25_accum(scores, d, tf, lennorm, w, K1, cut)
+        if n + 1 < len(plan) and 0 < topk <= len(scores):
+            theta = float(np.partition(scores, -topk)[-topk])
 
-    ranked = sorted(seen_docs, key=lambda d: scores[d], reverse=True)[:topk]
+    hits = np.flatnonzero(scores)
+    if hits.size == 0:
+        return _NO_HITS
+
+    # O(D) partial selection of the top-k, then order only those (ties by doc)
+    if 0 < topk < hits.size:
+        hits = np.sort(hits[np.argpartition(-scores[hits], topk - 1)[:topk]])
+    ranked = hits[np.argsort(-scores[hits], kind="stable")][:topk]
+    return docs[ranked].astype(np.int64), scores[ranked]
+
+def bm25_search(ddir: Path, query: str, topk: int = 10, k1: float | None = None, b: float | None = None):
+    """
+    Score docs with BM25. Returns list[ {msg, score, conv_id, title, role, ts} ].
+    Requires the BM25_FILES written by build_bm25 plus meta.json.
+    """
+    msgs, scores = bm25_rank(ddir, query, topk=topk, k1=k1, b=b)
+    meta = load_index(ddir)["meta"]
     out = []
-    for doc_id in ranked:
-        m = meta.get(str(doc_id), {})
+    for doc_id, score in zip(msgs.tolist(), scores.tolist()):
+        m = meta.get(doc_id, {})
         out.append({
-            "msg": int(doc_id),
-            "score": float(scores[doc_id]),
+            "msg": doc_id,
+            "score": score,
             "conv_id": m.get("conv_id"),
             "title": m.get("title"),
             "role": m.get("role"),
@@ -3,12 +3,12 @@ from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
-import tempfile, uuid, shutil, logging, os
+import tempfile, uuid, logging, os, io
 
 from .parse import parse_export
-from .index_bm25 import build_bm25, bm25_search
+from .index_bm25 import build_bm25, bm25_search, BM25_FILES
 from .search import search_bm25_with_snippets, get_conversation
-from .semantic import build_vecs, dense_search
+from .semantic import build_vecs, dense_search, VEC_FILES
 from .graph import build_edges, build_pagerank
 from .rerank import hybrid_search
 
@@ -18,6 +18,7 @@ DATA_ROOT.mkdir(parents=True, exist_ok=True)
 
 ALLOWED_EXTS = (".zip", ".json")
 MAX_UPLOAD_MB = 300
+COPY_CHUNK = 1 << 20
 
 log = logging.getLogger("uvicorn.error")
 
@@ -29,6 +30,55 @@ def dataset_dir(ds_id: str) -> Path:
 def new_dataset_id() -> str:
     return uuid.uuid4().hex[:10]
 
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large (> {MAX_UPLOAD_MB} MB)")
+
+def _copy_upload(src, dst, limit: int) -> int:
+    """
+    Copy an upload's spooled file into dst and return the bytes copied.
+    Uses os.sendfile / os.copy_file_range so the bytes stay in the kernel when
+    src is already backed by a real fd, else a 1 MB buffered copy. Raises 413 as soon
+    as more than `limit` bytes have been copied.
+    """
+    fd_copies = []
+    if hasattr(os, "sendfile"):
+        fd_copies.append(lambda i, o, off, n: os.sendfile(o, i, off, n))
+    if hasattr(os, "copy_file_range"):
+        fd_copies.append(lambda i, o, off, n: os.copy_file_range(i, o, n, off))
+    # A SpooledTemporaryFile still held in memory would roll over to disk on
+    # fileno() (3.11+), an extra full copy; only use fds it already has.
+    if not getattr(src, "_rolled", True):
+        fd_copies = []
+    try:
+        in_fd = src.fileno() if fd_copies else None
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fd_copies = []
+    start = src.tell()
+
+    for fd_copy in fd_copies:
+        copied = 0
+        try:
+            while True:
+                n = fd_copy(in_fd, dst.fileno(), start + copied, COPY_CHUNK)
+                if not n:
+                    return copied
+                copied += n
+                if copied > limit:
+                    raise _too_large()
+        except OSError:
+            # not supported for this pair of fds; start over with the next method
+            dst.seek(0)
+            dst.truncate()
+
+    src.seek(start)
+    copied = 0
+    while chunk := src.read(COPY_CHUNK):
+        dst.write(chunk)
+        copied += len(chunk)
+        if copied > limit:
+            raise _too_large()
+    return copied
+
 # ------------------ App ------------------
 app = FastAPI(title="Lexica Backend", version="0.1.0")
 
@@ -60,7 +110,7 @@ async def upload_dataset(request: Request, file: UploadFile = File(...)):
 
     cl = request.headers.get("content-length")
     if cl and int(cl) > MAX_UPLOAD_MB * 1024 * 1024:
-        raise HTTPException(status_code=413, detail=f"File too large (> {MAX_UPLOAD_MB} MB)")
+        raise _too_large()
 
     ds_id = new_dataset_id()
     out_ext = ".zip" if name.endswith(".zip") else ".json"
@@ -68,7 +118,10 @@ async def upload_dataset(request: Request, file: UploadFile = File(...)):
 
     try:
         with out_path.open("wb") as out:
-            shutil.copyfileobj(file.file, out)
+            _copy_upload(file.file, out, MAX_UPLOAD_MB * 1024 * 1024)
+    except HTTPException:
+        out_path.unlink(missing_ok=True)
+        raise
     except Exception as e:
         log.exception("Upload save failed")
         raise HTTPException(status_code=500, detail=f"Failed to save file: {e}") from e
@@ -138,10 +191,14 @@ def search_dataset(
 ):
     ddir = dataset_dir(dataset_id)
 
-    required = ["index.json", "idf.json", "stats.json", "doclen.json", "meta.json"]
+    # Parse artifacts first: rebuilding the index can't produce them
+    parsed = ["meta.json"]
     if mode == "snippets":
-        required.append("rows.jsonl")
-    for need in required:
+        parsed += ["rows.jsonl", "meta.npz", "convs.json"]
+    for need in parsed:
+        if not (ddir / need).exists():
+            raise HTTPException(400, f"{need} not found. Run /parse first.")
+    for need in BM25_FILES:
         if not (ddir / need).exists():
             raise HTTPException(400, f"Missing {need}. Build index first.")
 
@@ -174,7 +231,7 @@ def build_vectors(dataset_id: str):
 @app.get("/datasets/{dataset_id}/search_dense")
 def search_dense_only(dataset_id: str, q: str = Query(..., min_length=1), k: int = 10):
     ddir = dataset_dir(dataset_id)
-    for need in ["vecs.npz", "meta.json", "rows.jsonl"]:
+    for need in [*VEC_FILES, "meta.json", "rows.jsonl"]:
         if not (ddir / need).exists():
             raise HTTPException(400, f"Missing {need}. Build vectors via /index/vecs and parse first.")
     results = dense_search(ddir, q, topk=k)
@@ -200,8 +257,10 @@ def pagerank_build(
     half_life_days: float = Query(180.0, gt=0.0),
 ):
     ddir = dataset_dir(dataset_id)
-    if not (ddir / "edges.jsonl").exists():
-        raise HTTPException(400, "edges.jsonl not found. Run /graph/build first.")
+    if not (ddir / "edges.npz").exists():
+        raise HTTPException(400, "edges.npz not found. Run /graph/build first.")
+    if not (ddir / "meta.npz").exists():
+        raise HTTPException(400, "meta.npz not found. Run /parse first.")
     info = build_pagerank(ddir, alpha=alpha, half_life_days=half_life_days)
     return {"ok": True, **info}
 
@@ -209,7 +268,7 @@ def pagerank_build(
 @app.get("/datasets/{dataset_id}/search_hybrid")
 def search_hybrid(dataset_id: str, q: str, k: int = 10, explain: bool = False):
     ddir = dataset_dir(dataset_id)
-    for need in ["index.json", "idf.json", "doclen.json", "rows.jsonl"]:
+    for need in [*BM25_FILES, "rows.jsonl"]:
         if not (ddir / need).exists():
             raise HTTPException(400, f"Missing {need}. Build BM25 index and parse first.")
     results = hybrid_search(ddir, q, topk=k, explain=explain)
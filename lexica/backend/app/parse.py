@@ -8,14 +8,50 @@ import re
 import time
 import zipfile
 
+import numpy as np
+import orjson
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.json as pa_json
+except ImportError:  # optional; without it only rows.jsonl is written
+    feather = None
+
+try:
+    import ijson
+except ImportError:  # optional; without it exports are decoded in one piece
+    ijson = None
+
 SYSTEM_ROLES = {"system"}  # filter these out
-CODE_FENCE_RE = re.compile(r"```")
-INLINE_CODE_RE = re.compile(r"`[^`]+`")
+ROLE_CODES = ("user", "assistant")  # meta.npz "role" column codes
 WORD_RE = re.compile(r"[a-z0-9]+")
 
 
+def _loads(raw):
+    """
+    orjson.loads, falling back to the stdlib for input orjson rejects (e.g. an escaped
+    lone surrogate from a truncated emoji). Such surrogates come back as "?", so the
+    data can still be written out with orjson.dumps.
+    """
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        obj = json.loads(raw)
+        return orjson.loads(json.dumps(obj, ensure_ascii=False).encode("utf-8", errors="replace"))
+
+
 def _has_code(text: str) -> bool:
-    return bool(CODE_FENCE_RE.search(text) or INLINE_CODE_RE.search(text))
+    """A ``` fence, or inline `code`: two backticks with something other than a backtick between."""
+    if "```" in text:
+        return True
+    i = text.find("`")
+    while i != -1:
+        j = text.find("`", i + 1)
+        if j > i + 1:
+            return True
+        i = j
+    return False
 
 
 def _message_text(msg_obj: Dict[str, Any]) -> str:
@@ -130,14 +166,28 @@ def _collect_msgs_loose(conv: Dict[str, Any]) -> List[Dict[str, Any]]:
     return rows
 
 
+def _iter_conversations_stream(f):
+    """
+    Yield conversations one at a time from a binary conversations.json handle with ijson,
+    for either a top-level list or {"conversations": [...]}, so the whole export is never
+    held in memory. Numbers come back as floats, as with a regular JSON decode.
+    """
+    head = f.peek(64).lstrip(b"\xef\xbb\xbf \t\r\n")[:1]
+    prefix = "item" if head == b"[" else "conversations.item"
+    yield from ijson.items(f, prefix, use_float=True)
+
+
 def _iter_conversations_from_zip(zpath: Path):
     with zipfile.ZipFile(zpath, "r") as zf:
         names = zf.namelist()
         # Preferred file
         if "conversations.json" in names:
             with zf.open("conversations.json") as f:
+                if ijson is not None:
+                    yield from _iter_conversations_stream(f)
+                    return
                 raw = f.read().decode("utf-8", errors="ignore")
-                data = json.loads(raw)
+                data = _loads(raw)
                 if isinstance(data, list):
                     for conv in data:
                         yield conv
@@ -152,7 +202,7 @@ def _iter_conversations_from_zip(zpath: Path):
             try:
                 with zf.open(name) as f:
                     raw = f.read().decode("utf-8", errors="ignore")
-                    obj = json.loads(raw)
+                    obj = _loads(raw)
                     if isinstance(obj, dict) and (
                         "mapping" in obj or "messages" in obj or "items" in obj
                     ):
@@ -162,8 +212,12 @@ def _iter_conversations_from_zip(zpath: Path):
 
 
 def _iter_conversations_from_json(jpath: Path):
+    if ijson is not None:
+        with jpath.open("rb") as f:
+            yield from _iter_conversations_stream(f)
+        return
     raw = jpath.read_text(encoding="utf-8", errors="ignore")
-    data = json.loads(raw)
+    data = _loads(raw)
     if isinstance(data, list):
         for conv in data:
             yield conv
@@ -174,47 +228,63 @@ def _iter_conversations_from_json(jpath: Path):
 
 def parse_export(raw_path: Path, out_dir: Path) -> Tuple[int, int]:
     """
-    Parse raw.zip or raw.json → rows.jsonl, threads.json, meta.json
+    Parse raw.zip or raw.json → rows.jsonl, threads.json, meta.json, meta.npz, convs.json
+    (+ rows_offsets.npy, the byte offset of each row so msg i is bytes off[i]:off[i+1];
+    rows.feather, a columnar copy of rows.jsonl, when pyarrow is installed)
+    (meta.npz holds msg/conv/ts/role/has_code columns indexed by msg id; conv indexes
+    the parallel conv_id/title lists in convs.json)
     Returns (num_conversations, num_messages)
     """
     out_rows = out_dir / "rows.jsonl"
     out_threads = out_dir / "threads.json"
     out_meta = out_dir / "meta.json"
-
-    # Start fresh
-    if out_rows.exists():
-        out_rows.unlink()
+    out_meta_npz = out_dir / "meta.npz"
+    out_convs = out_dir / "convs.json"
+    out_feather = out_dir / "rows.feather"
+    out_offsets = out_dir / "rows_offsets.npy"
 
     meta: Dict[str, Any] = {}
     threads: Dict[str, List[int]] = {}
+    conv_index: Dict[str, int] = {}
+    conv_titles: List[str] = []
+    conv_col: List[int] = []
+    ts_col: List[int] = []
+    role_col: List[int] = []
+    code_col: List[bool] = []
+    offsets: List[int] = [0]
 
     msg_auto = 0
     conv_count = 0
 
-    def emit(conv_id: str, title: str, msgs: List[Dict[str, Any]]):
+    def emit(conv_id: str, title: str, msgs: List[Dict[str, Any]], fh):
         nonlocal msg_auto
         ordered: List[int] = []
+        ci = conv_index.setdefault(conv_id, len(conv_index))
+        if ci == len(conv_titles):
+            conv_titles.append(title)
         for m in msgs:
             text = m["text"]
+            code = _has_code(text)
             msg_id = msg_auto
             msg_auto += 1
 
-            # Append one JSON row per message
-            with out_rows.open("a", encoding="utf-8") as fh:
-                fh.write(
-                    json.dumps(
-                        {
-                            "msg": msg_id,
-                            "conv_id": conv_id,
-                            "conv_title": title,
-                            "ts": m["ts_iso"],
-                            "role": m["role"],
-                            "text": text,
-                            "has_code": _has_code(text),
-                        }
-                    )
-                    + "\n"
+            # One JSON row per message, through the shared buffered handle
+            n = fh.write(
+                orjson.dumps(
+                    {
+                        "msg": msg_id,
+                        "conv_id": conv_id,
+                        "conv_title": title,
+                        "ts": m["ts_iso"],
+                        "ts_sec": m["ts_sec"],
+                        "role": m["role"],
+                        "text": text,
+                        "has_code": code,
+                    }
                 )
+                + b"\n"
+            )
+            offsets.append(offsets[-1] + n)
 
             ordered.append(msg_id)
             meta[str(msg_id)] = {
@@ -222,9 +292,14 @@ def parse_export(raw_path: Path, out_dir: Path) -> Tuple[int, int]:
                 "title": title,
                 "len": len(WORD_RE.findall(text.lower())),
                 "ts": m["ts_iso"],
-                "has_code": _has_code(text),
+                "ts_sec": m["ts_sec"],
+                "has_code": code,
                 "role": m["role"],
             }
+            conv_col.append(ci)
+            ts_col.append(int(m["ts_sec"]))
+            role_col.append(ROLE_CODES.index(m["role"]))
+            code_col.append(code)
         if ordered:
             threads.setdefault(conv_id, []).extend(ordered)
 
@@ -234,16 +309,52 @@ def parse_export(raw_path: Path, out_dir: Path) -> Tuple[int, int]:
     else:
         conv_iter = _iter_conversations_from_json(raw_path)
 
-    for idx, conv in enumerate(conv_iter, start=1):
-        conv_count += 1
-        conv_id = str(conv.get("id") or conv.get("conversation_id") or f"c_{idx}")
-        title = conv.get("title") or f"Conversation {idx}"
-        msgs = _collect_from_mapping(conv) if conv.get("mapping") else _collect_msgs_loose(conv)
-        if not msgs:
-            continue
-        emit(conv_id, title, msgs)
+    # Rows are written fresh through one 1 MiB-buffered handle
+    with open(out_rows, "wb", buffering=1 << 20) as fh:
+        for idx, conv in enumerate(conv_iter, start=1):
+            conv_count += 1
+            conv_id = str(conv.get("id") or conv.get("conversation_id") or f"c_{idx}")
+            title = conv.get("title") or f"Conversation {idx}"
+            msgs = _collect_from_mapping(conv) if conv.get("mapping") else _collect_msgs_loose(conv)
+            if not msgs:
+                continue
+            emit(conv_id, title, msgs, fh)
+
+    np.save(out_offsets, np.array(offsets, dtype=np.int64))
+
+    # Columnar copy for random access by msg id; a stale one must not outlive its rows.jsonl
+    out_feather.unlink(missing_ok=True)
+    if feather is not None and msg_auto:
+        # explicit types keep e.g. "ts" a string rather than an inferred timestamp
+        schema = pa.schema([
+            ("msg", pa.int64()), ("conv_id", pa.string()), ("conv_title", pa.string()),
+            ("ts", pa.string()), ("ts_sec", pa.float64()), ("role", pa.string()),
+            ("text", pa.string()), ("has_code", pa.bool_()),
+        ])
+        # Arrow rejects a row that straddles two read blocks, so a block must hold the longest row
+        block = max(1 << 20, int(np.diff(offsets).max()) + 1)
+        try:
+            rows = pa_json.read_json(
+                out_rows,
+                read_options=pa_json.ReadOptions(block_size=block),
+                parse_options=pa_json.ParseOptions(explicit_schema=schema),
+            )
+            # uncompressed so readers can memory-map the columns instead of inflating them
+            feather.write_feather(rows, out_feather, compression="uncompressed")
+        except pa.ArrowException:
+            # optional artifact: readers fall back to rows_offsets.npy / rows.jsonl
+            out_feather.unlink(missing_ok=True)
 
-    out_threads.write_text(json.dumps(threads), encoding="utf-8")
-    out_meta.write_text(json.dumps(meta), encoding="utf-8")
+    out_threads.write_bytes(orjson.dumps(threads))
+    out_meta.write_bytes(orjson.dumps(meta))
+    np.savez(
+        out_meta_npz,
+        msg=np.arange(msg_auto, dtype=np.int64),
+        conv=np.array(conv_col, dtype=np.int32),
+        ts=np.array(ts_col, dtype=np.int64).astype("datetime64[s]"),
+        role=np.array(role_col, dtype=np.int8),
+        has_code=np.array(code_col, dtype=bool),
+    )
+    out_convs.write_bytes(orjson.dumps({"conv_id": list(conv_index), "title": conv_titles}))
 
     return conv_count, len(meta)
@@ -1,86 +1,102 @@
 from __future__ import annotations
 from pathlib import Path
-import json, math, time, datetime as dt
+import logging, math, time, datetime as dt
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Dict, List
 import numpy as np
+import orjson
 
-from .index_bm25 import bm25_search
-from .semantic import dense_search  # will be used if vecs.npz exists
+from .index_bm25 import bm25_search, load_index
+from .semantic import dense_search  # will be used if vecs.npy exists
+
+log = logging.getLogger("uvicorn.error")
+
+try:
+    import scipy.sparse as sp
+except ImportError:  # listed in requirements.txt; without it the PPR signal is dropped
+    sp = None
+    log.warning("scipy is not installed: hybrid search runs without the PPR signal (pip install scipy)")
 
 HALF_LIFE_DAYS = 90.0
 LN2 = math.log(2.0)
 
-def _z_norm(scores: Dict[int, float], ids: List[int]) -> Dict[int, float]:
-    arr = np.array([scores.get(i, 0.0) for i in ids], dtype=float)
-    if arr.size == 0:
-        return {i: 0.0 for i in ids}
-    mu, sd = float(arr.mean()), float(arr.std())
-    if sd < 1e-9:
-        return {i: 0.0 for i in ids}
-    z = (arr - mu) / (sd + 1e-9)
-    return {i: float(v) for i, v in zip(ids, z)}
-
-def _freshness(ts_iso: str, now: float) -> float:
-    try:
-        t = dt.datetime.fromisoformat(ts_iso.replace("Z", "+00:00")).timestamp()
-    except Exception:
+def _freshness_sec(ts_sec: float | None, now: float) -> float:
+    if ts_sec is None:
         return 0.0
-    age_days = max(0.0, (now - t) / 86400.0)
-    return float(math.exp(-LN2 * age_days / HALF_LIFE_DAYS))
+    age_days = max(0.0, (now - ts_sec) / 86400.0)
+    return math.exp(-LN2 * age_days / HALF_LIFE_DAYS)
+
+def _meta_ts_sec(meta: dict) -> float | None:
+    """Epoch seconds of a meta entry; meta.json parsed before ts_sec existed only has the ISO ts."""
+    ts_sec = meta.get("ts_sec")
+    if ts_sec is None and meta.get("ts"):
+        try:
+            ts_sec = dt.datetime.fromisoformat(meta["ts"].replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return ts_sec
+
+# Graph artifacts are cached per (path, mtime_ns) and shared read-only across queries
+@lru_cache(maxsize=4)
+def _cached_pr_global(path: str, mtime_ns: int):
+    data = orjson.loads(Path(path).read_bytes())
+    return MappingProxyType({int(k): float(v) for k, v in data.items()})
+
+@lru_cache(maxsize=4)
+def _cached_edges(path: str, mtime_ns: int):
+    """Global (dst, src) -> summed weight CSR matrix over msg ids."""
+    z = np.load(path)
+    n = int(max(z["src"].max(initial=-1), z["dst"].max(initial=-1))) + 1
+    return sp.csr_matrix((z["w"].astype(float), (z["dst"], z["src"])), shape=(n, n))
 
 def _load_pr_global(ddir: Path) -> Dict[int, float]:
     p = ddir / "pr_global.json"
     if not p.exists():
         return {}
     try:
-        data = json.loads(p.read_text(encoding="utf-8"))
-        return {int(k): float(v) for k, v in data.items()}
+        return _cached_pr_global(str(p), p.stat().st_mtime_ns)
     except Exception:
         return {}
 
 def _load_edges(ddir: Path):
-    p = ddir / "edges.jsonl"
-    if not p.exists():
-        return []
-    edges = []
-    with p.open("r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                obj = json.loads(line)
-                src = int(obj.get("src"))
-                dst = int(obj.get("dst"))
-                w = float(obj.get("w", 1.0))
-                edges.append((src, dst, w))
-            except Exception:
-                continue
-    return edges
+    p = ddir / "edges.npz"
+    if sp is None or not p.exists():
+        return None
+    try:
+        return _cached_edges(str(p), p.stat().st_mtime_ns)
+    except Exception:
+        return None
 
 def _mini_ppr(candidate_ids: List[int],
-              edges,
+              adj,
               seed_weights: Dict[int, float],
               alpha: float = 0.2,
               iters: int = 20) -> Dict[int, float]:
-    if not candidate_ids or not edges:
+    if not candidate_ids or adj is None:
         return {i: 0.0 for i in candidate_ids}
 
-    idx = {msg: k for k, msg in enumerate(candidate_ids)}
-    N = len(candidate_ids)
-
-    col_w = np.zeros(N, dtype=float)
-    rows, cols, vals = [], [], []
-    for s, d, w in edges:
-        if s in idx and d in idx:
-            i, j = idx[d], idx[s]
-            rows.append(i); cols.append(j); vals.append(float(w))
-            col_w[j] += float(w)
-    if not vals or float(np.sum(col_w)) == 0.0:
+    # Slice the candidates' subgraph out of the global matrix: the row slice only
+    # touches the candidates' own edges, never the whole edge list. Ids past the
+    # matrix's edge range have no edges, so their rows/cols are masked out.
+    n = adj.shape[0]
+    if n == 0:
+        return {i: 0.0 for i in candidate_ids}
+    ids = np.asarray(candidate_ids, dtype=np.int64)
+    inside = ids < n
+    if inside.all():
+        A = adj[ids][:, ids]
+    else:
+        sel = np.minimum(ids, n - 1)
+        mask = sp.diags(inside.astype(float))
+        A = mask @ adj[sel][:, sel] @ mask
+
+    # Column-normalize by each source's outgoing weight
+    col_w = np.asarray(A.sum(axis=0)).ravel()
+    if float(col_w.sum()) == 0.0:
         return {i: 0.0 for i in candidate_ids}
-
-    vals = np.array(vals, dtype=float)
     col_w[col_w == 0.0] = 1.0
-    vals /= np.take(col_w, cols)
-
-    A = (np.array(rows, int), np.array(cols, int), vals)
+    A = (A @ sp.diags(1.0 / col_w)).tocsr()
 
     v = np.array([max(0.0, seed_weights.get(i, 0.0)) for i in candidate_ids], dtype=float)
     if v.sum() <= 0:
@@ -89,9 +105,7 @@ def _mini_ppr(candidate_ids: List[int],
 
     r = v.copy()
     for _ in range(iters):
-        Ar = np.zeros(N, dtype=float)
-        Ar[A[0]] += A[2] * r[A[1]]
-        r = alpha * v + (1 - alpha) * Ar
+        r = alpha * v + (1 - alpha) * (A @ r)
 
     return {i: float(x) for i, x in zip(candidate_ids, r)}
 
@@ -119,8 +133,9 @@ def hybrid_search(ddir: Path, q: str, topk: int = 10, explain: bool = False):
         return []
 
     # ---- Signals
+    full_meta = load_index(ddir)["meta"]  # carries ts_sec, epoch seconds from parse (re-parse to add it)
     pr_global = _load_pr_global(ddir)
-    edges = _load_edges(ddir)
+    adj = _load_edges(ddir)
 
     # seed for query-biased PPR
     beta, gamma = 1.0, 1.0
@@ -130,27 +145,22 @@ def hybrid_search(ddir: Path, q: str, topk: int = 10, explain: bool = False):
         c = max(0.0, cos_map.get(i, 0.0))
         seeds[i] = (b ** beta) * ((c if c > 0 else b) ** gamma)
 
-    ppr_raw = _mini_ppr(cand_ids, edges, seeds) if edges else {i: 0.0 for i in cand_ids}
+    ppr_raw = _mini_ppr(cand_ids, adj, seeds)
 
-    fresh = {}
-    prior = {}
-    for i in cand_ids:
+    N = len(cand_ids)
+    fresh = np.zeros(N, dtype=float)
+    prior = np.zeros(N, dtype=float)
+    for n, i in enumerate(cand_ids):
         meta = id_meta.get(i, {})
-        ts = meta.get("ts") or ""
         role = (meta.get("role") or "").lower()
         has_code = bool(meta.get("has_code", False))
         snippet = meta.get("snippet") or meta.get("text") or ""
 
-        fresh[i] = _freshness(ts, now)
-        prior[i] = (0.30 if role == "assistant" else 0.0) \
+        fresh[n] = _freshness_sec(_meta_ts_sec(full_meta.get(i, {})), now)
+        prior[n] = (0.30 if role == "assistant" else 0.0) \
                  + (0.40 if has_code else 0.0) \
                  + (0.30 * min(len(snippet), 800) / 800.0)
 
-    bm_z    = _z_norm(bm_map,    cand_ids)
-    cos_z   = _z_norm(cos_map,   cand_ids) if cos_map else {i: 0.0 for i in cand_ids}
-    prg_z   = _z_norm(pr_global, cand_ids) if pr_global else {i: 0.0 for i in cand_ids}
-    ppr_z   = _z_norm(ppr_raw,   cand_ids) if ppr_raw else {i: 0.0 for i in cand_ids}
-
     W_BM25 = 1.00
     W_SEM  = 0.55
     W_AUTH = 0.20
@@ -158,24 +168,26 @@ def hybrid_search(ddir: Path, q: str, topk: int = 10, explain: bool = False):
     W_PRG  = 0.20
     W_PPR  = 0.25
 
-    fused = {}
-    for i in cand_ids:
-        fused[i] = (
-            W_BM25 * bm_z.get(i, 0.0) +
-            W_SEM  * cos_z.get(i, 0.0) +
-            W_AUTH * prior.get(i, 0.0) +
-            W_FRSH * fresh.get(i, 0.0) +
-            W_PRG  * prg_z.get(i, 0.0) +
-            W_PPR  * ppr_z.get(i, 0.0)
-        )
-
-    ranked = sorted(cand_ids, key=lambda x: fused[x], reverse=True)[:topk]
+    # Score signals as columns of one (N, 4) matrix, z-normalized per column
+    # (constant columns contribute 0); prior and freshness are already in [0, 1].
+    col = lambda d: np.fromiter((d.get(i, 0.0) for i in cand_ids), dtype=float, count=N)
+    S = np.stack([col(bm_map), col(cos_map), col(pr_global), col(ppr_raw)], axis=1)
+    mu, sd = S.mean(axis=0), S.std(axis=0)
+    Z = np.where(sd < 1e-9, 0.0, (S - mu) / (sd + 1e-9))
+    fused = Z @ np.array([W_BM25, W_SEM, W_PRG, W_PPR]) + W_AUTH * prior + W_FRSH * fresh
+
+    # O(N) partial selection of the top-k, then order only those (ties by candidate order)
+    ranked = np.arange(N)
+    if 0 < topk < N:
+        ranked = np.sort(np.argpartition(-fused, topk - 1)[:topk])
+    ranked = ranked[np.argsort(-fused[ranked], kind="stable")][:topk]
     out = []
-    for i in ranked:
+    for n in ranked.tolist():
+        i = cand_ids[n]
         meta = id_meta.get(i, {})
         rec = {
             "msg": i,
-            "score": fused[i],
+            "score": float(fused[n]),
             "conv_id": meta.get("conv_id"),
             "title": meta.get("title"),
             "role": meta.get("role"),
@@ -188,7 +200,7 @@ def hybrid_search(ddir: Path, q: str, topk: int = 10, explain: bool = False):
                 "cos": cos_map.get(i, 0.0),
                 "pr_global": pr_global.get(i, 0.0),
                 "ppr": ppr_raw.get(i, 0.0),
-                "fresh": fresh.get(i, 0.0),
+                "fresh": float(fresh[n]),
             })
         out.append(rec)
     return out
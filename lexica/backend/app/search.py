@@ -1,39 +1,99 @@
 from __future__ import annotations
 from pathlib import Path
-import json
-from datetime import datetime
+import numpy as np
+import orjson
+from datetime import datetime, timezone
+from functools import lru_cache
+import mmap
+from types import MappingProxyType
 
-from .index_bm25 import bm25_search
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # optional; rows are then read from rows.jsonl
+    pa = feather = None
 
-def _within(ts: str, after_iso: str | None, before_iso: str | None) -> bool:
-    if not ts: return True
+from .index_bm25 import bm25_rank, iter_jsonl, load_index
+from .parse import ROLE_CODES
+
+def _parse_bound(iso: str | None):
+    """ISO-8601 filter bound -> UTC datetime64[s] (naive input is taken as UTC); None if absent or unparseable."""
+    if not iso:
+        return None
     try:
-        t = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-    except Exception:
-        return True
-    if after_iso:
-        try:
-            a = datetime.fromisoformat(after_iso)
-            if t < a: return False
-        except Exception:
-            pass
-    if before_iso:
-        try:
-            b = datetime.fromisoformat(before_iso)
-            if t > b: return False
-        except Exception:
-            pass
-    return True
+        t = datetime.fromisoformat(iso.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if t.tzinfo is not None:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(t, "s")
+
+# Parsed files are cached per (path, mtime_ns), so a rebuilt file is re-read on next use.
+# Results are shared across requests and therefore handed out read-only.
+@lru_cache(maxsize=4)
+def _cached_json(path: str, mtime_ns: int):
+    return MappingProxyType(orjson.loads(Path(path).read_bytes()))
+
+@lru_cache(maxsize=4)
+def _cached_rows(path: str, mtime_ns: int):
+    """msg id -> row of rows.jsonl"""
+    return MappingProxyType({int(r["msg"]): r for r in iter_jsonl(Path(path))})
+
+@lru_cache(maxsize=4)
+def _cached_cols(path: str, mtime_ns: int):
+    """column name -> array of meta.npz, each indexed by msg id"""
+    with np.load(path) as z:
+        cols = {name: z[name] for name in z.files}
+    for arr in cols.values():
+        arr.flags.writeable = False
+    return MappingProxyType(cols)
+
+@lru_cache(maxsize=4)
+def _cached_table(path: str, mtime_ns: int):
+    """
+    rows.feather as a memory-mapped Arrow table; row i is msg i. None when reading it had to
+    copy the columns onto the Arrow heap (e.g. an lz4 file written before parse stopped
+    compressing), since pinning that here would cost more than the jsonl offsets path.
+    """
+    before = pa.total_allocated_bytes()
+    t = feather.read_table(path, memory_map=True)
+    if pa.total_allocated_bytes() - before > (1 << 16):
+        return None
+    return t
+
+def _load_json(p: Path):
+    return _cached_json(str(p), p.stat().st_mtime_ns)
+
+def _load_cols(ddir: Path):
+    p = ddir / "meta.npz"
+    return _cached_cols(str(p), p.stat().st_mtime_ns)
 
 def _load_rows(ddir: Path):
-    rows = []
-    with (ddir / "rows.jsonl").open("r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                rows.append(json.loads(line))
-            except Exception:
-                continue
-    return rows
+    p = ddir / "rows.jsonl"
+    return _cached_rows(str(p), p.stat().st_mtime_ns)
+
+def _take_rows(ddir: Path, msgs) -> dict:
+    """
+    msg id -> row for the given msg ids, by random access into rows.feather when available,
+    else into rows.jsonl through its byte-offset index; only the requested rows are decoded.
+    """
+    p = ddir / "rows.feather"
+    t = None
+    if feather is not None and p.exists():
+        t = _cached_table(str(p), p.stat().st_mtime_ns)
+    if t is not None:
+        ids = np.fromiter((m for m in msgs if 0 <= m < t.num_rows), dtype=np.int64)
+        return {r["msg"]: r for r in t.take(ids).to_pylist()}
+    po = ddir / "rows_offsets.npy"
+    if po.exists():
+        off = np.load(po)
+        ids = [m for m in msgs if 0 <= m < len(off) - 1]
+        if not ids:
+            return {}
+        with (ddir / "rows.jsonl").open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return {m: orjson.loads(mm[off[m]:off[m + 1]]) for m in ids}
+    rows = _load_rows(ddir)
+    return {m: rows[m] for m in msgs if m in rows}
 
 def search_bm25_with_snippets(
     ddir: Path, q: str, k: int = 10,
@@ -43,37 +103,49 @@ def search_bm25_with_snippets(
     before_iso: str | None = None,
     conv_id: str | None = None
 ):
-    meta = json.loads((ddir / "meta.json").read_text(encoding="utf-8"))
-    rows = _load_rows(ddir)
-    text_by_id = {int(r["msg"]): r.get("text") for r in rows}
+    msgs, scores = bm25_rank(ddir, q, topk=200)
+
+    # Filters are one vectorized mask over the meta.npz columns of the candidates
+    cols = _load_cols(ddir)
+    keep = np.ones(len(msgs), dtype=bool)
+    if conv_id:
+        conv_ids = _load_json(ddir / "convs.json")["conv_id"]
+        keep &= cols["conv"][msgs] == (conv_ids.index(conv_id) if conv_id in conv_ids else -1)
+    if role:
+        keep &= cols["role"][msgs] == (ROLE_CODES.index(role.lower()) if role.lower() in ROLE_CODES else -1)
+    if has_code is not None:
+        keep &= cols["has_code"][msgs] == has_code
+    after, before = _parse_bound(after_iso), _parse_bound(before_iso)
+    if after is not None:
+        keep &= cols["ts"][msgs] >= after
+    if before is not None:
+        keep &= cols["ts"][msgs] <= before
 
-    base = bm25_search(ddir, q, topk=200)
+    meta = load_index(ddir)["meta"]
+    msgs, scores = msgs[keep][:k].tolist(), scores[keep][:k].tolist()
+    rows = _take_rows(ddir, msgs)
     out = []
-    for r in base:
-        m = int(r["msg"])
-        mm = meta.get(str(m), {})
-        if conv_id and mm.get("conv_id") != conv_id:
-            continue
-        if role and (mm.get("role") or "").lower() != role.lower():
-            continue
-        if has_code is not None and bool(mm.get("has_code", False)) != has_code:
-            continue
-        if not _within(mm.get("ts") or "", after_iso, before_iso):
-            continue
-        r["snippet"] = text_by_id.get(m) or mm.get("snippet") or ""
-        out.append(r)
-        if len(out) >= k:
-            break
+    for m, score in zip(msgs, scores):
+        mm = meta.get(m, {})
+        out.append({
+            "msg": m,
+            "score": score,
+            "conv_id": mm.get("conv_id"),
+            "title": mm.get("title"),
+            "role": mm.get("role"),
+            "ts": mm.get("ts"),
+            "snippet": rows.get(m, {}).get("text") or mm.get("snippet") or "",
+        })
     return out
 
 def get_conversation(ddir: Path, conv_id: str, center_msg: int | None = None, window: int = 15):
-    # Try threads.json (if your parser writes it); else scan rows.jsonl
+    # Try threads.json (conv_id -> ordered msg ids, written by parse); else scan rows.jsonl
     tpath = ddir / "threads.json"
     if tpath.exists():
-        threads = json.loads(tpath.read_text(encoding="utf-8"))
-        conv = threads.get(conv_id)
+        conv = _load_json(tpath).get(conv_id)
         if conv:
-            msgs = conv["messages"]
+            rows = _take_rows(ddir, conv)
+            msgs = [rows[m] for m in conv if m in rows]
             if center_msg is None:
                 return {"conv_id": conv_id, "messages": msgs}
             idx = next((i for i, m in enumerate(msgs) if int(m["msg"]) == int(center_msg)), None)
@@ -84,12 +156,7 @@ def get_conversation(ddir: Path, conv_id: str, center_msg: int | None = None, wi
             return {"conv_id": conv_id, "messages": msgs[lo:hi]}
 
     # Fallback: filter rows.jsonl by conv_id
-    rows = []
-    with (ddir / "rows.jsonl").open("r", encoding="utf-8") as f:
-        for line in f:
-            r = json.loads(line)
-            if r.get("conv_id") == conv_id:
-                rows.append(r)
+    rows = [r for r in _load_rows(ddir).values() if r.get("conv_id") == conv_id]
     rows.sort(key=lambda x: x.get("msg"))
     if center_msg is None:
         return {"conv_id": conv_id, "messages": rows}
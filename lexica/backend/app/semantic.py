@@ -1,65 +1,96 @@
 from __future__ import annotations
 from pathlib import Path
-import json
 import numpy as np
-import re
+import orjson
+
+from .index_bm25 import iter_jsonl, load_meta
 
 # Very light-weight char-trigram hashing for “semantic nudging”
 DIMS = 1024
-WORD = re.compile(r"\S+")
 
-def _char_trigrams(s: str):
-    s = " " + s.lower() + " "
-    return [s[i:i+3] for i in range(len(s)-2)]
+TRI_K = 257  # polynomial base for byte-trigram hashes
+# Fibonacci-hashing multiplier: the high 32 bits of poly * TRI_MIX (mod 2**64) pick the
+# bucket, so trigrams whose polynomials agree in their low bits still spread out
+TRI_MIX = np.uint64(0x9E3779B97F4A7C15)
+EMBED_BATCH = 4096  # rows scattered per bincount in _embed_batch
+MATVEC_ROWS = 1 << 16  # int8 rows upcast per block in dense_search
+
+# On-disk artifacts written by build_vecs: msg ids, int8 rows and their per-row scales
+VEC_FILES = ("ids.npy", "vecs.npy", "vec_scale.npy")
+
+def _embed_batch(texts, dims: int = DIMS) -> np.ndarray:
+    """
+    (len(texts), dims) L2-normalized byte-trigram count vectors. The padded,
+    lowercased UTF-8 texts of a batch are hashed as one buffer (trigrams that
+    straddle two texts are dropped) and counted with a single flat bincount.
+    """
+    mat = np.zeros((len(texts), dims), dtype=np.float32)
+    for r0 in range(0, len(texts), EMBED_BATCH):
+        enc = [(" " + t.lower() + " ").encode("utf-8") for t in texts[r0:r0 + EMBED_BATCH]]
+        lens = np.fromiter(map(len, enc), dtype=np.int64, count=len(enc))
+        b = np.frombuffer(b"".join(enc), dtype=np.uint8).astype(np.uint32)
+        h = (b[:-2] * (TRI_K * TRI_K) + b[1:-1] * TRI_K + b[2:]).astype(np.uint64) * TRI_MIX
+        bucket = ((h >> np.uint64(32)) % np.uint64(dims)).astype(np.int64)
+        # trigram at position p belongs to text r iff it starts at least 3 bytes before r's end
+        row = np.repeat(np.arange(len(enc)), lens)[:-2]
+        ok = np.arange(len(h)) <= (np.cumsum(lens) - 3)[row]
+        flat = row[ok] * dims + bucket[ok]
+        mat[r0:r0 + len(enc)] = np.bincount(flat, minlength=len(enc) * dims).reshape(len(enc), dims)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    np.divide(mat, norms, out=mat, where=norms > 0)
+    return mat
 
 def _embed(text: str, dims: int = DIMS) -> np.ndarray:
-    v = np.zeros(dims, dtype=np.float32)
-    for tri in _char_trigrams(text):
-        h = (hash(tri) % dims + dims) % dims
-        v[h] += 1.0
-    n = np.linalg.norm(v)
-    if n > 0: v /= n
-    return v
+    return _embed_batch([text], dims)[0]
 
 def build_vecs(ddir: Path, dims: int = DIMS):
     rows_path = ddir / "rows.jsonl"
     assert rows_path.exists(), "rows.jsonl not found. Run /parse first."
 
-    ids = []
-    vecs = []
-
-    with rows_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            row = json.loads(line)
-            msg = int(row["msg"])
-            txt = row.get("text") or ""
-            ids.append(msg)
-            vecs.append(_embed(txt, dims))
+    ids, texts = [], []
+    for row in iter_jsonl(rows_path):
+        ids.append(int(row["msg"]))
+        texts.append(row.get("text") or "")
 
     ids = np.array(ids, dtype=np.int64)
-    vecs = np.stack(vecs, axis=0).astype(np.float32)
+    vecs = _embed_batch(texts, dims)
 
-    np.savez_compressed(ddir / "vecs.npz", ids=ids, vecs=vecs)
-    (ddir / "vec_meta.json").write_text(json.dumps({"dims": dims, "count": int(ids.shape[0])}), encoding="utf-8")
-    return {"count": int(ids.shape[0]), "dims": dims, "path": str(ddir / "vecs.npz")}
+    # int8 rows with a per-row scale (vec ~= q8 * scale), as raw .npy files that queries mmap
+    scale = np.abs(vecs).max(axis=1, initial=0.0) / 127.0
+    q8 = np.round(vecs / np.where(scale > 0, scale, 1.0)[:, None]).astype(np.int8)
+    (ddir / "vecs.npz").unlink(missing_ok=True)  # pre-.npy layout
+    np.save(ddir / "ids.npy", ids)
+    np.save(ddir / "vecs.npy", np.ascontiguousarray(q8))
+    np.save(ddir / "vec_scale.npy", scale.astype(np.float32))
+    (ddir / "vec_meta.json").write_bytes(orjson.dumps({"dims": dims, "count": int(ids.shape[0])}))
+    return {"count": int(ids.shape[0]), "dims": dims, "path": str(ddir / "vecs.npy")}
 
 def dense_search(ddir: Path, query: str, topk: int = 10):
-    zpath = ddir / "vecs.npz"
-    assert zpath.exists(), "vecs.npz not found. Build with /index/vecs"
+    assert all((ddir / name).exists() for name in VEC_FILES), "vecs.npy not found. Build with /index/vecs"
 
-    z = np.load(zpath)
-    ids, mat = z["ids"], z["vecs"]
+    ids = np.load(ddir / "ids.npy", mmap_mode="r")
+    mat = np.load(ddir / "vecs.npy", mmap_mode="r")
+    scale = np.load(ddir / "vec_scale.npy", mmap_mode="r")
     qv = _embed(query, mat.shape[1])
 
-    # cosine with normalized rows = dot
-    sims = (mat @ qv).astype(np.float32)
-    top = np.argsort(-sims)[:topk]
+    # cosine with normalized rows = dot, dequantized by each row's scale; the mmapped
+    # int8 rows are paged in and upcast block by block so each block is one float32 GEMV
+    sims = np.empty(len(ids), dtype=np.float32)
+    for r0 in range(0, len(ids), MATVEC_ROWS):
+        blk = mat[r0:r0 + MATVEC_ROWS]
+        sims[r0:r0 + len(blk)] = blk.astype(np.float32) @ qv
+    sims *= scale
+    # O(N) partial selection of the top-k, then order only those (ties by row)
+    top = np.arange(len(sims))
+    if 0 < topk < len(sims):
+        top = np.sort(np.argpartition(-sims, topk - 1)[:topk])
+    top = top[np.argsort(-sims[top], kind="stable")][:topk]
 
-    meta = json.loads((ddir / "meta.json").read_text(encoding="utf-8"))
+    meta = load_meta(ddir)
     out = []
     for j in top:
         msg = int(ids[j]); sc = float(sims[j])
-        m = meta.get(str(msg)) or {}
+        m = meta.get(msg) or {}
         out.append({
             "msg": msg,
             "score": sc,